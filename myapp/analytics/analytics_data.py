@@ -1,37 +1,69 @@
+import heapq
+import itertools
 import json
-import random
+import threading
 import time
+import zlib
+from collections import Counter, deque
 
 import altair as alt
 import pandas as pd
 
+from myapp.bootstrap import english_stopwords
+from myapp.core.utils import TOKEN_RE, detect_user_agent
+
+# IDs de query crecientes y únicos dentro del proceso
+_query_id_counter = itertools.count(1)
+_query_id_lock = threading.Lock()
+
 
 class AnalyticsData:
     """
     In-memory persistence object.
     """
 
-    # clicks totales por doc_id
-    fact_clicks = dict([])
+    # máximo de filas guardadas por tabla de hechos (las más antiguas se descartan)
+    MAX_FACTS = 100_000
+
+    # número de documentos más clicados que se mantienen precalculados
+    TOP_CLICKS = 50
+
+    def __init__(self):
+        # protege las actualizaciones read-modify-write (los append de deque ya son atómicos)
+        self._lock = threading.Lock()
+
+        # clicks totales por doc_id
+        self.fact_clicks = Counter()
+
+        # min-heap de [count, doc_id] con los TOP_CLICKS docs más clicados, y su entrada por doc_id
+        self._top_clicks = []
+        self._top_clicks_entries = {}
+
+        # total de clicks registrados, y la spec del gráfico de vistas calculada para ese total
+        self._total_clicks = 0
+        self._views_spec = (0, None)
 
-    # lista de peticiones HTTP
-    fact_requests = []
+        # lista de peticiones HTTP
+        self.fact_requests = deque(maxlen=self.MAX_FACTS)
 
-    # lista de queries
-    fact_queries = []
+        # lista de queries
+        self.fact_queries = deque(maxlen=self.MAX_FACTS)
 
-    # eventos de click (query + doc + rank)
-    fact_click_events = []
+        # eventos de click (query + doc + rank)
+        self.fact_click_events = deque(maxlen=self.MAX_FACTS)
 
-    # tiempos de permanencia (dwell time)
-    fact_dwell_times = []
+        # tiempos de permanencia (dwell time)
+        self.fact_dwell_times = deque(maxlen=self.MAX_FACTS)
 
     def save_query_terms(self, terms: str) -> int:
         """
         Guarda info básica de la query y devuelve un ID.
         """
-        query_id = random.randint(0, 100000)
-        tokens = [t for t in terms.split() if t]
+        with _query_id_lock:
+            query_id = next(_query_id_counter)
+        # mismos términos que indexa el buscador (sin stopwords)
+        stopwords = english_stopwords()
+        tokens = [t for t in TOKEN_RE.findall(terms.lower()) if t not in stopwords]
 
         self.fact_queries.append(
             {
@@ -44,13 +76,48 @@ class AnalyticsData:
         )
         return query_id
 
-    # registrar cada request HTTP
+    # registrar un click en un documento y devolver su total de clicks
+    def register_doc_click(self, doc_id: str) -> int:
+        with self._lock:
+            self.fact_clicks[doc_id] += 1
+            self._total_clicks += 1
+            count = self.fact_clicks[doc_id]
+            self._update_top_clicks(doc_id, count)
+            return count
+
+    # mantener el heap de top clicks (llamar con self._lock adquirido)
+    def _update_top_clicks(self, doc_id: str, count: int):
+        entry = self._top_clicks_entries.get(doc_id)
+        if entry is not None:
+            # ya está en el top: actualizar su contador y restaurar el heap (como mucho TOP_CLICKS elementos)
+            entry[0] = count
+            heapq.heapify(self._top_clicks)
+        elif len(self._top_clicks) < self.TOP_CLICKS:
+            entry = [count, doc_id]
+            heapq.heappush(self._top_clicks, entry)
+            self._top_clicks_entries[doc_id] = entry
+        elif count > self._top_clicks[0][0]:
+            # los contadores crecen de uno en uno, así que solo puede desplazar al mínimo
+            entry = [count, doc_id]
+            evicted = heapq.heapreplace(self._top_clicks, entry)
+            del self._top_clicks_entries[evicted[1]]
+            self._top_clicks_entries[doc_id] = entry
+
+    # documentos más clicados como lista de (doc_id, count), de más a menos clicks
+    def top_clicked_docs(self) -> list:
+        with self._lock:
+            ranked = sorted(self._top_clicks, reverse=True)
+        return [(doc_id, count) for count, doc_id in ranked]
+
+    # registrar cada request HTTP (se guarda un hash estable (CRC32) del user agent y el navegador, no el texto completo)
     def register_request(self, path: str, method: str, user_agent: str, ip: str, session_id: str):
+        browser = detect_user_agent(user_agent).get("browser", {}).get("name") or "Unknown"
         self.fact_requests.append(
             {
                 "path": path,
                 "method": method,
-                "user_agent": user_agent,
+                "user_agent_hash": zlib.crc32((user_agent or "").encode("utf-8")),
+                "browser": browser,
                 "ip": ip,
                 "session_id": session_id,
                 "timestamp": time.time(),
@@ -80,16 +147,22 @@ class AnalyticsData:
             }
         )
 
-    def plot_number_of_views(self):
+    def plot_number_of_views(self) -> dict | None:
         """
-        Altair bar chart: número de vistas por documento.
+        Altair bar chart: número de vistas por documento, como spec Vega-Lite (dict JSON)
+        para renderizar en el navegador con vega-embed. Devuelve None si no hay clicks.
+        La spec solo se recalcula cuando llegan clicks nuevos.
         """
-        if not self.fact_clicks:
-            return "<h3>No clicks registered yet</h3>"
+        with self._lock:
+            total_clicks = self._total_clicks
+            cached_total, cached_spec = self._views_spec
+            if cached_total == total_clicks:
+                return cached_spec
+            clicks = list(self.fact_clicks.items())
 
         data = [
             {"Document ID": doc_id, "Number of Views": count}
-            for doc_id, count in self.fact_clicks.items()
+            for doc_id, count in clicks
         ]
         df = pd.DataFrame(data)
 
@@ -103,7 +176,10 @@ class AnalyticsData:
             .properties(title="Number of Views per Document")
         )
 
-        return chart.to_html()
+        spec = json.loads(chart.to_json())
+        with self._lock:
+            self._views_spec = (total_clicks, spec)
+        return spec
 
 
 class ClickedDoc:
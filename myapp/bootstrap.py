@@ -0,0 +1,56 @@
+"""
+One-time process initialization: environment variables (.env) and NLTK data.
+"""
+
+import os
+from functools import lru_cache
+
+import nltk
+from dotenv import load_dotenv
+
+
+# Fallback if NLTK data cannot be found nor downloaded
+FALLBACK_STOPWORDS = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for',
+    'of', 'with', 'by', 'from', 'is', 'are', 'was', 'were', 'be', 'been',
+    'being', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would',
+    'could', 'should', 'may', 'might', 'must', 'can'
+})
+
+_bootstrapped = False
+
+
+def bootstrap():
+    """
+    Load .env and make sure the NLTK stopwords are available.
+    Only the first call does any work, so every entry point can call it.
+    """
+    global _bootstrapped
+    if _bootstrapped:
+        return
+
+    load_dotenv()  # take environment variables from .env
+
+    # NLTK data is cached under NLTK_DATA (default ~/.cache/nltk_data) and downloaded only once
+    nltk_data_dir = os.getenv("NLTK_DATA", os.path.expanduser("~/.cache/nltk_data"))
+    if nltk_data_dir not in nltk.data.path:
+        nltk.data.path.append(nltk_data_dir)
+    try:
+        nltk.data.find("corpora/stopwords")
+    except LookupError:
+        nltk.download("stopwords", download_dir=nltk_data_dir, quiet=True)
+
+    _bootstrapped = True
+
+
+@lru_cache(maxsize=None)
+def english_stopwords() -> frozenset:
+    """
+    English stopwords from NLTK, or a small built-in list if NLTK data is unavailable.
+    Loaded on first use (not at import time) and cached; runs `bootstrap()` if needed.
+    """
+    bootstrap()
+    try:
+        return frozenset(nltk.corpus.stopwords.words('english'))
+    except LookupError:
+        return FALLBACK_STOPWORDS
@@ -1,10 +1,16 @@
 import datetime
+import re
+from functools import lru_cache
 from random import random
 
+import httpagentparser
 from faker import Faker
 
 fake = Faker()
 
+# Tokens are maximal runs of lowercase letters and digits (shared by search and analytics)
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
 def get_random_date():
     """Generate a random datetime between `start` and `end`"""
     return fake.date_time_between(start_date='-30d', end_date='now')
@@ -15,3 +21,9 @@ def get_random_date_in(start, end):
     return start + datetime.timedelta(
         # Get a random amount of seconds between `start` and `end`
         seconds=random.randint(0, int((end - start).total_seconds())), )
+
+
+@lru_cache(maxsize=4096)
+def detect_user_agent(user_agent):
+    """Parse a raw User-Agent header (cached, the same few browsers repeat across requests)"""
+    return httpagentparser.detect(user_agent or "")
@@ -1,8 +1,9 @@
 import os
+from functools import lru_cache
+
 from groq import Groq
-from dotenv import load_dotenv
 
-load_dotenv()
+from myapp.bootstrap import bootstrap
 
 
 class RAGGenerator:
@@ -12,32 +13,37 @@ class RAGGenerator:
         "RAG is not available. Check your credentials (.env file) or account limits."
     )
 
-    def __init__(self, model_env_var: str = "GROQ_MODEL"):
+    def __init__(self, corpus: dict, model_env_var: str = "GROQ_MODEL"):
+        bootstrap()  # GROQ_* settings come from .env, also when used outside web_app
+        self.corpus = corpus
         self.model_env_var = model_env_var
         self.model_name = os.environ.get(model_env_var, "llama-3.1-8b-instant")
         self.client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
+        # corpus documents do not change during a run, so each product line is formatted once
+        self._format_product = lru_cache(maxsize=100_000)(self._format_product)
+
+    def _format_product(self, pid: str) -> str:
+        """Format the static metadata of a corpus product as one prompt line."""
+        doc = self.corpus[pid]
+        return (
+            f"PID: {doc.pid} | Title: {doc.title} | "
+            f"Price: {doc.selling_price} | Discount: {doc.discount} | "
+            f"Rating: {doc.average_rating} | InStock: {not doc.out_of_stock} | "
+            f"URL: {doc.url or ''}"
+        )
 
     def _format_documents(self, retrieved_results, top_N):
         """Format documents into a metadata-rich block for the prompt."""
         lines = []
 
+        # items are RankedDocument or (Document, score) pairs
         for item in retrieved_results[:top_N]:
-            if isinstance(item, (list, tuple)):
-                doc, bm25_score = item
-            else:
-                doc = item
-                bm25_score = getattr(doc, "score", None)
-
-            lines.append(
-                f"PID: {getattr(doc, 'pid', '')} | Title: {getattr(doc, 'title', '')} | "
-                f"Price: {getattr(doc, 'selling_price', 'N/A')} | Discount: {getattr(doc, 'discount', 'N/A')} | "
-                f"Rating: {getattr(doc, 'average_rating', 'N/A')} | InStock: {not bool(getattr(doc, 'out_of_stock', False))} | "
-                f"BM25: {bm25_score if bm25_score is not None else 'N/A'} | URL: {getattr(doc, 'url', '')}"
-            )
+            doc, score = item[0], item[1]
+            lines.append(f"{self._format_product(doc.pid)} | Score: {score:.4f}")
 
         return "\n".join(lines) if lines else "(no retrieved products)"
 
-    def generate_response(self, user_query: str, retrieved_results: list, top_N: int = 20) -> str:
+    def generate_response(self, user_query: str, retrieved_results: list, top_N: int = 10) -> str:
         """Generate a Top-3 recommendation based on retrieved products."""
         try:
             formatted_results = self._format_documents(retrieved_results, top_N)
@@ -45,7 +51,7 @@ class RAGGenerator:
             prompt = (
                 "You are an expert product advisor. From the retrieved products below, pick the Top 3 products "
                 "best suited for the user's request. For each, provide a one-line explanation referencing price, "
-                "rating, discount, stock, or BM25 score.\n\n"
+                "rating, discount, stock, or relevance score.\n\n"
                 "Return your answer as numbered items (1., 2., 3.) formatted exactly like:\n"
                 "1. PID - Title - Why: <short justification>\n\n"
                 "Retrieved Products:\n"
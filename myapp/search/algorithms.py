@@ -1,34 +1,89 @@
 """
 Search algorithms module for IRWA Search Engine.
 Implements BM25 ranking algorithm for product search.
+
+The index follows the BM25S approach: every (term, document) BM25
+contribution is computed once at build time and stored in a sparse matrix,
+so answering a query only requires summing the rows of the query terms.
 """
 
-import re
+import os
+import json
 import math
+import hashlib
+import shutil
+import tempfile
 from collections import Counter, defaultdict
-from nltk.corpus import stopwords
+from itertools import chain
 
-from myapp.search.objects import Document
+import numpy as np
+from scipy import sparse
 
+from myapp.bootstrap import english_stopwords
+from myapp.core.utils import TOKEN_RE
 
-# Initialize English stopwords
 try:
-    STOPWORDS = set(stopwords.words('english'))
-except LookupError:
-    # Fallback if NLTK data not downloaded
-    STOPWORDS = {
-        'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for',
-        'of', 'with', 'by', 'from', 'is', 'are', 'was', 'were', 'be', 'been',
-        'being', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would',
-        'could', 'should', 'may', 'might', 'must', 'can'
-    }
+    from numba import njit
+except ImportError:
+    # numba is optional, scoring falls back to NumPy
+    njit = None
+
+
+def _accumulate_postings(term_ids, indptr, indices, data, scores, candidates):
+    """
+    Add the posting lists of `term_ids` into the dense `scores` buffer.
+
+    BM25 contributions are always positive, so a document is recorded in
+    `candidates` the first time its score leaves zero.
+
+    Returns:
+        int: number of candidates written
+    """
+    n_candidates = 0
+    for t in term_ids:
+        for p in range(indptr[t], indptr[t + 1]):
+            doc = indices[p]
+            if scores[doc] == 0.0:
+                candidates[n_candidates] = doc
+                n_candidates += 1
+            scores[doc] += data[p]
+    return n_candidates
+
+
+# Query terms update overlapping documents, so the kernel stays serial (no prange)
+_accumulate_postings_jit = njit(cache=True, fastmath=True)(_accumulate_postings) if njit else None
+
+
+def corpus_fingerprint(docs):
+    """
+    Hash of everything a saved index depends on: the documents, their order,
+    the indexed text and the metadata used for boosts.
+
+    Args:
+        docs: iterable of Document objects in index column order
+
+    Returns:
+        str: hex digest
+    """
+    digest = hashlib.sha256()
+    for doc in docs:
+        fields = [doc.pid, doc.title, doc.description, doc.average_rating, doc.out_of_stock]
+        digest.update(json.dumps(fields).encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
 
 
 class BM25Index:
     """
     BM25 search index for document ranking.
     Uses Okapi BM25 algorithm with metadata boosts.
+
+    Build it once (e.g. at application startup or offline with `save`) and
+    reuse it for every query.
     """
+
+    # Score matrix arrays persisted as .npy files so they can be memory-mapped
+    _ARRAY_FILES = ('indptr', 'indices', 'data', 'doc_boosts')
     
     def __init__(self, corpus, k1=1.5, b=0.75):
         """
@@ -42,18 +97,32 @@ class BM25Index:
         self.k1 = k1
         self.b = b
         self.corpus = corpus
+        self.stopwords = english_stopwords()
+        
+        # Documents are addressed by integer position (the score matrix column)
+        self.doc_ids = list(corpus.keys())  # position -> doc_id
+        self.docs = list(corpus.values())  # position -> Document
         
         # Build the index
         self.doc_frequencies = defaultdict(int)  # {term: count of docs containing term}
-        self.doc_lengths = {}  # {doc_id: token count}
-        self.doc_term_freqs = {}  # {doc_id: {term: frequency}}
+        self.doc_lengths = None  # int array: token count per position
+        self.doc_term_freqs = []  # per position: {term: frequency}
         self.avg_doc_length = 0
+        self.idf = {}  # {term: IDF score}
+        self.doc_norm = None  # float array per position: k1 * (1 - b + b * doc_length / avg_doc_length)
+
+        # Eager BM25 scores
+        self.vocab = {}  # {term: row index}
+        self.score_matrix = None  # sparse (vocab_size, n_docs) matrix of BM25 contributions
+        self.doc_boosts = None  # metadata boost per column
         
         self._build_index()
+        self._build_score_matrix()
+        self._warm_up()
     
     def _tokenize(self, text):
         """
-        Tokenize text: lowercase, remove punctuation, split, filter stopwords.
+        Tokenize text: lowercase, extract alphanumeric runs, filter stopwords.
         
         Args:
             text: raw text string
@@ -61,112 +130,91 @@ class BM25Index:
         Returns:
             list of tokens
         """
-        if not text:
-            return []
-        
-        # Convert to lowercase
-        text = text.lower()
-        
-        # Remove URLs and special characters, keep only alphanumeric and spaces
-        text = re.sub(r'[^a-z0-9\s]', ' ', text)
-        
-        # Split on whitespace
-        tokens = text.split()
-        
-        # Filter out stopwords and empty strings
-        tokens = [t for t in tokens if t and t not in STOPWORDS]
-        
-        return tokens
+        return [t for t in TOKEN_RE.findall(text.lower()) if t not in self.stopwords]
     
     def _build_index(self):
         """Build the BM25 index from corpus."""
-        total_length = 0
+        doc_lengths = []
         
-        for doc_id, doc in self.corpus.items():
-            # Combine title and description for indexing
-            text = f"{doc.title or ''} {doc.description or ''}"
-            
-            # Tokenize
-            tokens = self._tokenize(text)
-            
-            # Store document length
-            self.doc_lengths[doc_id] = len(tokens)
-            total_length += len(tokens)
+        for doc in self.docs:
+            # Index title and description tokens together, without concatenating the texts
+            tokens = chain(self._tokenize(doc.title or ''), self._tokenize(doc.description or ''))
             
             # Store term frequencies for this document
             term_freq = Counter(tokens)
-            self.doc_term_freqs[doc_id] = dict(term_freq)
+            self.doc_term_freqs.append(dict(term_freq))
+            
+            # Store document length
+            doc_lengths.append(sum(term_freq.values()))
             
             # Update document frequency (how many docs contain each term)
             for term in term_freq.keys():
                 self.doc_frequencies[term] += 1
         
+        self.doc_lengths = np.array(doc_lengths, dtype=np.int64)
+        
         # Calculate average document length
-        if len(self.corpus) > 0:
-            self.avg_doc_length = total_length / len(self.corpus)
+        if len(self.docs) > 0:
+            self.avg_doc_length = float(self.doc_lengths.mean())
         else:
             self.avg_doc_length = 0
-    
-    def _calculate_idf(self, term):
-        """
-        Calculate IDF (Inverse Document Frequency) for a term.
-        
-        Args:
-            term: search term
-            
-        Returns:
-            float: IDF score
-        """
-        df = self.doc_frequencies.get(term, 0)
-        N = len(self.corpus)
-        
-        # BM25 IDF formula
-        idf = math.log((N - df + 0.5) / (df + 0.5) + 1.0)
-        return idf
-    
-    def _calculate_bm25_score(self, doc_id, query_tokens):
+
+        # IDF depends only on the term, so compute it once per vocabulary entry
+        N = len(self.docs)
+        self.idf = {
+            term: math.log((N - df + 0.5) / (df + 0.5) + 1.0)
+            for term, df in self.doc_frequencies.items()
+        }
+
+        # Length normalization depends only on the document
+        if self.avg_doc_length > 0:
+            self.doc_norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / self.avg_doc_length)
+        else:
+            self.doc_norm = np.full(len(self.docs), self.k1 * (1 - self.b))
+
+    def _build_score_matrix(self):
         """
-        Calculate BM25 score for a document given query tokens.
-        
-        Args:
-            doc_id: document identifier
-            query_tokens: list of query terms
-            
-        Returns:
-            float: BM25 score
+        Precompute the BM25 contribution of every (term, document) pair.
+
+        Rows are terms and columns are documents, stored in CSR format so the
+        rows of the query terms can be sliced cheaply at search time.
         """
-        score = 0.0
-        doc_length = self.doc_lengths.get(doc_id, 0)
-        term_freqs = self.doc_term_freqs.get(doc_id, {})
-        
-        for term in query_tokens:
-            # Get term frequency in document (0 if not present)
-            tf = term_freqs.get(term, 0)
-            
-            if tf == 0:
-                continue
-            
-            # Calculate IDF
-            idf = self._calculate_idf(term)
-            
-            # BM25 formula
-            numerator = tf * (self.k1 + 1)
-            denominator = tf + self.k1 * (1 - self.b + self.b * doc_length / self.avg_doc_length)
-            
-            score += idf * (numerator / denominator)
-        
-        return score
+        N = len(self.docs)
+        self.vocab = {term: i for i, term in enumerate(self.doc_frequencies)}
+
+        k1_plus_1 = self.k1 + 1
+
+        rows, cols, values = [], [], []
+        for col, (term_freqs, doc_norm) in enumerate(zip(self.doc_term_freqs, self.doc_norm.tolist())):
+            for term, tf in term_freqs.items():
+                idf = self.idf[term]
+
+                # BM25 formula
+                numerator = tf * k1_plus_1
+                denominator = tf + doc_norm
+
+                rows.append(self.vocab[term])
+                cols.append(col)
+                values.append(idf * (numerator / denominator))
+
+        self.score_matrix = sparse.csr_matrix(
+            (np.asarray(values, dtype=np.float32), (rows, cols)),
+            shape=(len(self.vocab), N),
+        )
+        self.doc_boosts = np.array(
+            [self._metadata_boost(doc) for doc in self.docs],
+            dtype=np.float32,
+        )
     
-    def _apply_metadata_boosts(self, score, doc):
+    def _metadata_boost(self, doc):
         """
-        Apply metadata-based score boosts.
+        Compute the metadata-based score boost for a document.
         
         Args:
-            score: base BM25 score
             doc: Document object
             
         Returns:
-            float: boosted score
+            float: multiplicative boost
         """
         boost = 1.0
         
@@ -178,7 +226,52 @@ class BM25Index:
         if not doc.out_of_stock:
             boost *= 1.1
         
-        return score * boost
+        return boost
+    
+    def _warm_up(self):
+        """
+        Compile the numba kernel for this index's array types now, so the
+        first search request does not pay the JIT cost.
+        """
+        if _accumulate_postings_jit is not None and self.vocab:
+            self._score_postings([0])
+    
+    def _score_postings(self, term_ids):
+        """
+        Accumulate BM25 scores over the posting lists of the given terms.
+
+        Each CSR row of the score matrix is a posting list: the columns of
+        `indices[indptr[t]:indptr[t + 1]]` are the documents containing term t
+        and `data` holds their precomputed BM25 contributions. Uses the numba
+        kernel when numba is installed, NumPy otherwise.
+
+        Args:
+            term_ids: list of vocabulary row indices (repeats count again)
+
+        Returns:
+            tuple (candidates, scores): sorted column indices of the matched
+            documents and their summed BM25 scores
+        """
+        indptr = self.score_matrix.indptr
+        indices = self.score_matrix.indices
+        data = self.score_matrix.data
+
+        if _accumulate_postings_jit is not None:
+            term_ids = np.asarray(term_ids, dtype=np.int64)
+            n_postings = int((indptr[term_ids + 1] - indptr[term_ids]).sum())
+            scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+            candidates = np.empty(n_postings, dtype=np.int64)
+            n_candidates = _accumulate_postings_jit(term_ids, indptr, indices, data, scores, candidates)
+            candidates = np.sort(candidates[:n_candidates])
+            return candidates, scores[candidates]
+
+        postings = [slice(indptr[t], indptr[t + 1]) for t in term_ids]
+        doc_cols = np.concatenate([indices[p] for p in postings])
+        weights = np.concatenate([data[p] for p in postings])
+
+        candidates, positions = np.unique(doc_cols, return_inverse=True)
+        scores = np.bincount(positions, weights=weights, minlength=len(candidates))
+        return candidates, scores
     
     def search(self, query_text, top_k=20):
         """
@@ -189,69 +282,178 @@ class BM25Index:
             top_k: number of top results to return
             
         Returns:
-            list of Document objects, ranked by relevance (highest first)
+            list of (Document, score) tuples, ranked by relevance (highest first);
+            empty when top_k is zero or negative
         """
+        if top_k <= 0:
+            return []
+        
         # Tokenize query
         query_tokens = self._tokenize(query_text)
         
-        if not query_tokens:
-            # Empty query, return empty results
+        term_ids = [self.vocab[t] for t in query_tokens if t in self.vocab]
+        
+        if not term_ids:
+            # Empty query or no known terms, return empty results
             return []
         
-        # Score all documents
-        scores = {}
-        for doc_id in self.corpus.keys():
-            bm25_score = self._calculate_bm25_score(doc_id, query_tokens)
-            doc = self.corpus[doc_id]
-            final_score = self._apply_metadata_boosts(bm25_score, doc)
-            scores[doc_id] = final_score
+        # Only documents in the posting lists of the query terms can score
+        candidates, scores = self._score_postings(term_ids)
+        scores *= self.doc_boosts[candidates]
         
-        # Sort by score descending
-        ranked_docs = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        # Select the top-k candidates without sorting all of them. Every score tied
+        # with the k-th one is kept, then ties are broken by corpus order
+        # (candidates are sorted columns), so the cutoff is deterministic
+        k = min(top_k, len(scores))
+        kth_score = np.partition(scores, len(scores) - k)[len(scores) - k]
+        selected = np.flatnonzero(scores >= kth_score)
+        top = selected[np.lexsort((candidates[selected], -scores[selected]))[:k]]
         
-        # Get top-k documents and construct Document objects with ranking
-        results = []
-        for rank, (doc_id, score) in enumerate(ranked_docs[:top_k]):
-            doc = self.corpus[doc_id]
-            # Create a new Document with the ranking score
-            result_doc = Document(
-                _id=doc.pid,
-                pid=doc.pid,
-                title=doc.title,
-                description=doc.description,
-                brand=doc.brand,
-                category=doc.category,
-                sub_category=doc.sub_category,
-                product_details=doc.product_details,
-                seller=doc.seller,
-                out_of_stock=doc.out_of_stock,
-                selling_price=doc.selling_price,
-                discount=doc.discount,
-                actual_price=doc.actual_price,
-                average_rating=doc.average_rating,
-                url=doc.url,
-                images=doc.images
+        # Return the corpus Document objects themselves, paired with their score
+        return [
+            (self.docs[candidates[i]], float(scores[i]))
+            for i in top
+        ]
+
+    
+    def save(self, path):
+        """
+        Persist the eager BM25 scores to a directory.
+        
+        Only what `search` needs is stored: the CSR arrays of the score matrix,
+        the metadata boosts, the vocabulary and the column -> doc_id mapping,
+        plus a fingerprint of the corpus so `load` can detect a stale index.
+        
+        Files are written to a temporary sibling directory that is then moved
+        into place, so a half-written index is never found at `path`.
+        
+        Args:
+            path: target directory (replaced if it exists)
+        """
+        path = os.path.abspath(path)
+        parent = os.path.dirname(path)
+        os.makedirs(parent, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix='.index-', dir=parent)
+        os.chmod(tmp_path, 0o755)  # mkdtemp creates it private to the owner
+        try:
+            self._write_files(tmp_path)
+            if os.path.exists(path):
+                # directories cannot be replaced while non-empty: move the old one aside first
+                old_path = tempfile.mkdtemp(prefix='.index-old-', dir=parent)
+                os.replace(path, os.path.join(old_path, 'index'))
+                os.replace(tmp_path, path)
+                shutil.rmtree(old_path, ignore_errors=True)
+            else:
+                os.replace(tmp_path, path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+    
+    def _write_files(self, path):
+        """Write the index files of `save` into an existing directory."""
+        arrays = {
+            'indptr': self.score_matrix.indptr,
+            'indices': self.score_matrix.indices,
+            'data': self.score_matrix.data,
+            'doc_boosts': self.doc_boosts,
+        }
+        for name in self._ARRAY_FILES:
+            np.save(os.path.join(path, f'{name}.npy'), arrays[name])
+        
+        with open(os.path.join(path, 'vocab.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.vocab, f)
+        with open(os.path.join(path, 'doc_ids.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.doc_ids, f)
+        with open(os.path.join(path, 'params.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'k1': self.k1,
+                'b': self.b,
+                'n_docs': len(self.doc_ids),
+                'corpus_fingerprint': corpus_fingerprint(self.docs),
+            }, f)
+    
+    @classmethod
+    def load(cls, path, corpus):
+        """
+        Load an index written by `save`, memory-mapping the score arrays.
+        
+        The per-document statistics used while building (doc_lengths,
+        doc_term_freqs, idf, ...) are not restored; they are not needed to search.
+        
+        Args:
+            path: directory written by `save`
+            corpus: dict of {doc_id: Document} the index was built from
+            
+        Returns:
+            BM25Index
+            
+        Raises:
+            ValueError: if the corpus differs from the one the index was built
+                from (documents added/removed/reordered, or text/boost metadata changed)
+        """
+        try:
+            with open(os.path.join(path, 'vocab.json'), encoding='utf-8') as f:
+                vocab = json.load(f)
+            with open(os.path.join(path, 'doc_ids.json'), encoding='utf-8') as f:
+                doc_ids = json.load(f)
+            with open(os.path.join(path, 'params.json'), encoding='utf-8') as f:
+                params = json.load(f)
+            arrays = {
+                name: np.asarray(np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r'))
+                for name in cls._ARRAY_FILES
+            }
+        except (OSError, ValueError) as e:
+            # missing, truncated or corrupt files (json.JSONDecodeError is a ValueError)
+            raise ValueError(f"Index at {path} is incomplete or unreadable ({e}), rebuild it") from e
+        
+        if 'corpus_fingerprint' not in params:
+            raise ValueError(f"Index at {path} has no corpus fingerprint, rebuild it")
+        if len(corpus) != params['n_docs'] or list(corpus) != doc_ids:
+            raise ValueError(
+                f"Index at {path} covers {params['n_docs']} documents but the corpus has "
+                f"{len(corpus)} (or lists them in another order), rebuild it"
             )
-            results.append((result_doc, score))
+        if corpus_fingerprint(corpus.values()) != params.get('corpus_fingerprint'):
+            raise ValueError(f"Index at {path} was built from different corpus contents, rebuild it")
+        if len(arrays['indptr']) != len(vocab) + 1 or len(arrays['doc_boosts']) != len(doc_ids):
+            raise ValueError(f"Index at {path} has inconsistent score arrays, rebuild it")
         
-        return results
+        index = cls.__new__(cls)
+        index.k1 = params['k1']
+        index.b = params['b']
+        index.corpus = corpus
+        index.stopwords = english_stopwords()
+        index.doc_ids = doc_ids
+        index.docs = [corpus[doc_id] for doc_id in doc_ids]
+        index.doc_frequencies = defaultdict(int)
+        index.doc_lengths = None
+        index.doc_term_freqs = []
+        index.avg_doc_length = 0
+        index.idf = {}
+        index.doc_norm = None
+        index.vocab = vocab
+        index.score_matrix = sparse.csr_matrix(
+            (arrays['data'], arrays['indices'], arrays['indptr']),
+            shape=(len(vocab), len(doc_ids)),
+            copy=False,
+        )
+        index.doc_boosts = arrays['doc_boosts']
+        index._warm_up()
+        return index
 
 
-def search_in_corpus(query_text, corpus, top_k=20):
+def search_in_corpus(query_text, index, top_k=20):
     """
-    Main search function for searching in corpus.
+    Main search function for searching in corpus. Thin delegate to `BM25Index.search`.
     
     Args:
         query_text: search query string
-        corpus: dict of {doc_id: Document}
+        index: prebuilt BM25Index over the corpus
         top_k: number of results to return (default: 20)
         
     Returns:
-        list of Document objects ranked by BM25 relevance
+        list of (Document, score) tuples ranked by BM25 relevance
     """
-    # Create BM25 index
-    index = BM25Index(corpus, k1=1.5, b=0.75)
-    
     # Search and get results with scores
     results_with_scores = index.search(query_text, top_k=top_k)
     # Return the list of (Document, score) so callers can perform hybrid reranking
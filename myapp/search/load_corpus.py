@@ -1,9 +1,25 @@
+from dataclasses import dataclass
+
+import numpy as np
 import pandas as pd
 
 from myapp.search.objects import Document
 from typing import List, Dict
 
 
+@dataclass
+class CorpusColumns:
+    """
+    Column-oriented copy of the corpus metadata used for reranking.
+    Every array is aligned with the same row order; `pid_to_idx` maps a pid to its row.
+    """
+    pid_to_idx: Dict[str, int]
+    prices: np.ndarray  # float32, NaN when unknown
+    ratings: np.ndarray  # float32, 0 when unknown
+    discounts: np.ndarray  # float32, 0 when unknown
+    out_of_stock: np.ndarray  # bool
+
+
 def load_corpus(path) -> List[Document]:
     """
     Load file and transform to dictionary with each document as an object for easier treatment when needed for displaying
@@ -27,3 +43,20 @@ def _build_corpus(df: pd.DataFrame) -> Dict[str, Document]:
         corpus[doc.pid] = doc
     return corpus
 
+
+
+def build_corpus_columns(corpus: Dict[str, Document]) -> CorpusColumns:
+    """
+    Build aligned metadata arrays from the corpus
+    :param corpus:
+    :return:
+    """
+    docs = list(corpus.values())
+    return CorpusColumns(
+        pid_to_idx={doc.pid: i for i, doc in enumerate(docs)},
+        prices=np.array([np.nan if doc.selling_price is None else doc.selling_price for doc in docs],
+                        dtype=np.float32),
+        ratings=np.array([doc.average_rating or 0.0 for doc in docs], dtype=np.float32),
+        discounts=np.array([doc.discount or 0.0 for doc in docs], dtype=np.float32),
+        out_of_stock=np.array([bool(doc.out_of_stock) for doc in docs], dtype=bool),
+    )
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, field_validator
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, NamedTuple
 from datetime import datetime
 import re
 
@@ -80,6 +80,15 @@ class Document(BaseModel):
         return self.model_dump_json(indent=2)
 
 
+class RankedDocument(NamedTuple):
+    """
+    A corpus Document as ranked for one query, without copying it
+    """
+    doc: Document
+    score: float
+    url: str
+
+
 class StatsDocument(BaseModel):
     """
     Original corpus data as an object
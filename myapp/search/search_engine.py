@@ -1,131 +1,96 @@
-from myapp.search.objects import Document
+from heapq import nlargest
+from operator import itemgetter
+
+import numpy as np
+
+from myapp.search.objects import RankedDocument
 from myapp.search.algorithms import search_in_corpus
 
 
+# Weights of [similarity, rating, discount, price, popularity] in the hybrid score
+HYBRID_WEIGHTS = np.array([0.6, 0.15, 0.1, 0.05, 0.05])
 
 
 class SearchEngine:
     """Class that implements the search engine logic"""
 
-    def search(self, search_query, search_id, corpus, analytics_data=None):
+    def __init__(self, index, columns):
+        """
+        Args:
+            index: BM25Index built once over the corpus and reused for every query
+            columns: CorpusColumns with the metadata used for hybrid reranking
+        """
+        self.index = index
+        self.columns = columns
+
+    def search(self, search_query, search_id, analytics_data=None, top_k=20):
         """
         Search and rerank results using a hybrid of BM25 similarity and commercial metadata.
 
         Args:
             search_query: raw query string
             search_id: analytics id for the query
-            corpus: dict of corpus documents
             analytics_data: optional AnalyticsData instance to use popularity (clicks)
+            top_k: number of results to return (default: 20)
 
         Returns:
-            list of Document objects (with `score` populated) ranked by final hybrid score
+            list of RankedDocument (doc, score, url) ranked by final hybrid score
         """
         print("Search query:", search_query)
 
         results = []
 
         # Retrieve top-k using BM25. search_in_corpus now returns list of (Document, bm25_score)
-        bm25_results = search_in_corpus(search_query, corpus, top_k=20)
+        bm25_results = search_in_corpus(search_query, self.index, top_k=top_k)
 
         if not bm25_results:
             return []
 
-        # Build arrays for normalization
-        bm25_scores = [s for (_d, s) in bm25_results]
-        max_bm25 = max(bm25_scores) if bm25_scores else 1.0
-        min_price = None
-        max_price = None
-        click_counts = {}
-
-        # Collect prices and clicks for normalization
-        for doc, s in bm25_results:
-            price = getattr(doc, 'selling_price', None)
-            if price is not None:
-                if min_price is None or price < min_price:
-                    min_price = price
-                if max_price is None or price > max_price:
-                    max_price = price
-
-            # popularity from analytics_data.fact_clicks (if available)
-            if analytics_data and hasattr(analytics_data, 'fact_clicks'):
-                clicks = analytics_data.fact_clicks.get(doc.pid, 0)
-            else:
-                clicks = 0
-            click_counts[doc.pid] = clicks
-
-        max_clicks = max(click_counts.values()) if click_counts else 1
-
-        # Compute hybrid final score and create result Documents
-        hybrid_results = []
-        for doc, s in bm25_results:
-            # Normalize similarity
-            sim_norm = (s / max_bm25) if max_bm25 else 0.0
-
-            # Normalize rating (assume 5.0 max)
-            rating = getattr(doc, 'average_rating', None) or 0.0
-            rating_norm = min(max(rating / 5.0, 0.0), 1.0)
-
-            # Normalize discount (assume percentage or raw number; clamp to 0-100)
-            discount = getattr(doc, 'discount', None) or 0.0
-            try:
-                discount_val = float(discount)
-            except Exception:
-                discount_val = 0.0
-            discount_norm = min(max(discount_val / 100.0, 0.0), 1.0)
-
-            # Price score: lower better. If no price info, neutral 0.5
-            price = getattr(doc, 'selling_price', None)
-            if price is None or min_price is None or max_price is None or max_price == min_price:
-                price_score = 0.5
-            else:
-                price_score = 1.0 - ((price - min_price) / (max_price - min_price))
-
-            # Popularity normalized
-            clicks = click_counts.get(doc.pid, 0)
-            popularity_norm = (clicks / max_clicks) if max_clicks else 0.0
-
-            # Base weighted combination (weights chosen conservatively)
-            final_score = (
-                0.6 * sim_norm
-                + 0.15 * rating_norm
-                + 0.1 * discount_norm
-                + 0.05 * price_score
-                + 0.05 * popularity_norm
-            )
-
-            # Apply a small multiplicative boost for in-stock items
-            if not getattr(doc, 'out_of_stock', False):
-                final_score *= 1.05
-
-            hybrid_results.append((doc, final_score))
-
-        # Sort by hybrid score descending
-        hybrid_results.sort(key=lambda x: x[1], reverse=True)
-
-        # Construct final Document objects with URL selection and attach score
-        for rank, (doc, score) in enumerate(hybrid_results):
-            original_url = getattr(doc, 'url', None)
-            link_url = original_url if original_url else f"/doc_details?pid={doc.pid}&search_id={search_id}"
-
-            result_doc = Document(
-                _id=doc.pid,
-                pid=doc.pid,
-                title=doc.title,
-                description=doc.description,
-                brand=doc.brand,
-                category=doc.category,
-                sub_category=doc.sub_category,
-                product_details=doc.product_details,
-                seller=doc.seller,
-                out_of_stock=doc.out_of_stock,
-                selling_price=doc.selling_price,
-                discount=doc.discount,
-                actual_price=doc.actual_price,
-                average_rating=doc.average_rating,
-                url=link_url,
-                images=doc.images,
-                score=score,
-            )
-            results.append(result_doc)
+        docs = [doc for doc, _s in bm25_results]
+        idxs = np.array([self.columns.pid_to_idx[doc.pid] for doc in docs])
+
+        # Normalize similarity
+        bm25_scores = np.array([s for _d, s in bm25_results], dtype=np.float64)
+        max_bm25 = bm25_scores.max()
+        sim_norm = bm25_scores / max_bm25 if max_bm25 else np.zeros_like(bm25_scores)
+
+        # Normalize rating (assume 5.0 max) and discount (percentage, clamp to 0-100)
+        rating_norm = np.clip(self.columns.ratings[idxs] / 5.0, 0.0, 1.0)
+        discount_norm = np.clip(self.columns.discounts[idxs] / 100.0, 0.0, 1.0)
+
+        # Price score: lower better. Missing prices (NaN) or no price range are neutral 0.5
+        prices = self.columns.prices[idxs]
+        has_price = ~np.isnan(prices)
+        price_score = np.full(len(docs), 0.5)
+        if has_price.any():
+            min_price = prices[has_price].min()
+            max_price = prices[has_price].max()
+            if max_price > min_price:
+                price_score[has_price] = 1.0 - (prices[has_price] - min_price) / (max_price - min_price)
+
+        # popularity from analytics_data.fact_clicks (if available)
+        if analytics_data and hasattr(analytics_data, 'fact_clicks'):
+            clicks = np.array([analytics_data.fact_clicks.get(doc.pid, 0) for doc in docs], dtype=np.float64)
+        else:
+            clicks = np.zeros(len(docs))
+        max_clicks = clicks.max()
+        popularity_norm = clicks / max_clicks if max_clicks else np.zeros_like(clicks)
+
+        # Base weighted combination (weights chosen conservatively)
+        features = np.stack([sim_norm, rating_norm, discount_norm, price_score, popularity_norm], axis=1)
+        final_scores = features @ HYBRID_WEIGHTS
+
+        # Apply a small multiplicative boost for in-stock items
+        final_scores[~self.columns.out_of_stock[idxs]] *= 1.05
+
+        hybrid_results = zip(docs, final_scores.tolist())
+
+        # Keep the top-k by hybrid score, highest first
+        hybrid_results = nlargest(top_k, hybrid_results, key=itemgetter(1))
+
+        # Pair each original Document with its score and link URL
+        for doc, score in hybrid_results:
+            link_url = doc.url if doc.url else f"/doc_details?pid={doc.pid}&search_id={search_id}"
+            results.append(RankedDocument(doc=doc, score=score, url=link_url))
 
         return results
@@ -0,0 +1,36 @@
+"""
+Offline build step for the BM25 search index.
+
+Loads the corpus configured in .env (DATA_FILE_PATH), builds the eager BM25
+index and saves it to INDEX_DIR_PATH (default: index/) so web_app.py can load
+it at startup instead of indexing the corpus itself. It also downloads the
+NLTK stopwords into the cache, so the app starts without network access.
+
+Usage (from the project root):
+    python -m scripts.build_index
+"""
+
+import os
+
+from myapp.bootstrap import bootstrap
+from myapp.search.algorithms import BM25Index
+from myapp.search.load_corpus import load_corpus
+
+
+def main():
+    bootstrap()
+
+    root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    file_path = os.path.join(root, os.getenv("DATA_FILE_PATH"))
+    index_path = os.path.join(root, os.getenv("INDEX_DIR_PATH", "index"))
+
+    corpus = load_corpus(file_path)
+    print("Corpus is loaded: {} documents".format(len(corpus)))
+
+    index = BM25Index(corpus, k1=1.5, b=0.75)
+    index.save(index_path)
+    print("BM25 index saved to {} ({} terms)".format(index_path, len(index.vocab)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,23 @@
 import os
 import time
-import random
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from json import JSONEncoder
 
-import httpagentparser  # for getting the user agent as json
-from flask import Flask, render_template, session
+from flask import Flask, jsonify, render_template, session
 from flask import request
 
 from myapp.analytics.analytics_data import AnalyticsData, ClickedDoc
-from myapp.search.load_corpus import load_corpus
+from myapp.core.utils import detect_user_agent  # for getting the user agent as json
+from myapp.search.algorithms import BM25Index
+from myapp.search.load_corpus import build_corpus_columns, load_corpus
 from myapp.search.objects import Document, StatsDocument
 from myapp.search.search_engine import SearchEngine
 from myapp.generation.rag import RAGGenerator
-from dotenv import load_dotenv
+from myapp.bootstrap import bootstrap
 
-load_dotenv()  # take environment variables from .env
+bootstrap()  # load .env and NLTK data once per process
 
 
 # *** for using method to_json in objects ***
@@ -34,12 +37,17 @@ app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY")
 # open browser dev tool to see the cookies
 app.session_cookie_name = os.getenv("SESSION_COOKIE_NAME")
-# instantiate our search engine
-search_engine = SearchEngine()
 # instantiate our in memory persistence
 analytics_data = AnalyticsData()
-# instantiate RAG generator
-rag_generator = RAGGenerator()
+# RAG answers are generated in background threads while the results page is served;
+# the page then fetches them from /rag_stream with an unguessable token tied to the session
+_rag_pool = ThreadPoolExecutor(max_workers=8)
+_rag_futures = {}  # {token: (session_id, Future)}
+_rag_futures_lock = threading.Lock()
+_RAG_MAX_PENDING = 1000  # drop the oldest answers that were never fetched
+_RAG_TIMEOUT_SECONDS = 30  # give up waiting for Groq so request threads are not held forever
+# answers queued or being generated; searches skip RAG when all slots are taken
+_rag_slots = threading.BoundedSemaphore(32)
 
 # load documents corpus into memory.
 full_path = os.path.realpath(__file__)
@@ -48,11 +56,27 @@ file_path = path + "/" + os.getenv("DATA_FILE_PATH")
 corpus = load_corpus(file_path)
 # Log first element of corpus to verify it loaded correctly:
 print("\nCorpus is loaded... \n First element:\n", list(corpus.values())[0])
+# load the BM25 index built offline (python -m scripts.build_index), or build it once
+# here if it is missing; either way it is shared across requests
+index_path = path + "/" + os.getenv("INDEX_DIR_PATH", "index")
+search_index = None
+if os.path.isdir(index_path):
+    try:
+        search_index = BM25Index.load(index_path, corpus)
+    except ValueError as e:
+        print("Prebuilt index cannot be used ({}), building it in memory...".format(e))
+else:
+    print("No prebuilt index at {}, building it in memory...".format(index_path))
+if search_index is None:
+    search_index = BM25Index(corpus, k1=1.5, b=0.75)
+search_engine = SearchEngine(index=search_index, columns=build_corpus_columns(corpus))
+# instantiate RAG generator
+rag_generator = RAGGenerator(corpus)
 
 
 def get_session_id() -> str:
     if "session_id" not in session:
-        session["session_id"] = str(random.randint(0, 10**9))
+        session["session_id"] = secrets.token_hex(16)
     return session["session_id"]
 
 
@@ -69,7 +93,7 @@ def index():
     print("Raw user browser:", user_agent)
 
     user_ip = request.remote_addr
-    agent = httpagentparser.detect(user_agent)
+    agent = detect_user_agent(user_agent)
 
     print("Remote IP: {} - JSON user browser {}".format(user_ip, agent))
     print(session)
@@ -119,15 +143,24 @@ def search_form_post():
         session.pop("last_click_doc_id", None)
 
     results = search_engine.search(
-        search_query, search_id, corpus, analytics_data=analytics_data
+        search_query, search_id, analytics_data=analytics_data
     )
 
     # guardar ranking (posición) de cada doc en sesión para analytics
-    session["last_ranking"] = {doc.pid: idx for idx, doc in enumerate(results)}
-
-    # generate RAG response based on user query and retrieved results
-    rag_response = rag_generator.generate_response(search_query, results)
-    print("RAG response:", rag_response)
+    session["last_ranking"] = {item.doc.pid: idx for idx, item in enumerate(results)}
+
+    # generate RAG response in the background; the results page fetches it from /rag_stream
+    rag_token = None
+    if _rag_slots.acquire(blocking=False):
+        future = _rag_pool.submit(rag_generator.generate_response, search_query, results)
+        future.add_done_callback(lambda _: _rag_slots.release())
+        rag_token = secrets.token_urlsafe(16)
+        with _rag_futures_lock:
+            _rag_futures[rag_token] = (session_id, future)
+            while len(_rag_futures) > _RAG_MAX_PENDING:
+                _rag_futures.pop(next(iter(_rag_futures)))[1].cancel()
+    else:
+        print("RAG backlog is full, skipping the summary for this search")
 
     found_count = len(results)
     session["last_found_count"] = found_count
@@ -139,11 +172,35 @@ def search_form_post():
         results_list=results,
         page_title="Results",
         found_counter=found_count,
-        rag_response=rag_response,
         search_id=search_id,
+        rag_token=rag_token,
     )
 
 
+@app.route("/rag_stream", methods=["GET"])
+def rag_stream():
+    """
+    Wait for the RAG answer of a search started in /search and return it as JSON.
+    Only the session that ran the search can fetch it.
+    """
+    token = request.args.get("token")
+    session_id = get_session_id()
+    with _rag_futures_lock:
+        entry = _rag_futures.get(token)
+        if entry is None or entry[0] != session_id:
+            return jsonify({"rag_response": None}), 404
+        _rag_futures.pop(token)
+    future = entry[1]
+
+    try:
+        rag_response = future.result(timeout=_RAG_TIMEOUT_SECONDS)
+    except FutureTimeoutError:
+        print("RAG response timed out after {}s".format(_RAG_TIMEOUT_SECONDS))
+        return jsonify({"rag_response": None})
+    print("RAG response:", rag_response)
+    return jsonify({"rag_response": rag_response})
+
+
 @app.route("/doc_details", methods=["GET"])
 def doc_details():
     """
@@ -164,16 +221,9 @@ def doc_details():
     search_id = request.args.get("search_id")
 
     # store data in statistics table 1 (clicks acumulados por doc)
-    if clicked_doc_id in analytics_data.fact_clicks.keys():
-        analytics_data.fact_clicks[clicked_doc_id] += 1
-    else:
-        analytics_data.fact_clicks[clicked_doc_id] = 1
+    clicks = analytics_data.register_doc_click(clicked_doc_id)
 
-    print(
-        "fact_clicks count for id={} is {}".format(
-            clicked_doc_id, analytics_data.fact_clicks[clicked_doc_id]
-        )
-    )
+    print("fact_clicks count for id={} is {}".format(clicked_doc_id, clicks))
     print(analytics_data.fact_clicks)
 
     #registrar request de detalle
@@ -215,10 +265,10 @@ def stats():
     Show simple statistics example.
     """
 
+    # already sorted by number of clicks
     docs = []
-    for doc_id in analytics_data.fact_clicks:
+    for doc_id, count in analytics_data.top_clicked_docs():
         row: Document = corpus[doc_id]
-        count = analytics_data.fact_clicks[doc_id]
         doc = StatsDocument(
             pid=row.pid,
             title=row.title,
@@ -228,37 +278,34 @@ def stats():
         )
         docs.append(doc)
 
-    # simulate sort by ranking
-    docs.sort(key=lambda doc: doc.count, reverse=True)
     return render_template("stats.html", clicks_data=docs)
 
 
 @app.route('/dashboard')
 def dashboard():
     # Top visited docs
-    visited_docs = []
-    for doc_id, count in analytics_data.fact_clicks.items():
-        d: Document = corpus[doc_id]
-        visited_docs.append({"doc_id": doc_id, "count": count})
-
-    visited_docs = sorted(visited_docs, key=lambda x: x["count"], reverse=True)
+    visited_docs = [
+        {"doc_id": doc_id, "count": count}
+        for doc_id, count in analytics_data.top_clicked_docs()
+    ]
 
     return render_template(
         'dashboard.html',
         clicks_data=visited_docs,
-        queries_data=analytics_data.fact_queries,
-        requests_data=analytics_data.fact_requests,
-        click_events_data=analytics_data.fact_click_events,
+        queries_data=list(analytics_data.fact_queries),
+        requests_data=list(analytics_data.fact_requests),
+        click_events_data=list(analytics_data.fact_click_events),
         page_title="Dashboard"
     )
 
 
 
-# New route added for generating an examples of basic Altair plot (used for dashboard)
+# Vega-Lite spec of the Altair "number of views" plot, rendered client-side by the dashboard
 @app.route("/plot_number_of_views", methods=["GET"])
 def plot_number_of_views():
-    return analytics_data.plot_number_of_views()
+    return jsonify(analytics_data.plot_number_of_views() or {})
 
 
 if __name__ == "__main__":
-    app.run(port=8088, host="0.0.0.0", threaded=False, debug=os.getenv("DEBUG"))
+    # local development server; in production serve wsgi:app with gunicorn (see Procfile)
+    app.run(port=8088, host="0.0.0.0", threaded=True, debug=os.getenv("DEBUG"))
@@ -0,0 +1,6 @@
+"""
+WSGI entry point for production servers, e.g.:
+    gunicorn --workers 1 --threads 8 --worker-class gthread wsgi:app
+"""
+
+from web_app import app